@@ -4,10 +4,96 @@ Database Schema Diagram Generator
 Generates an ERD (Entity Relationship Diagram) from the PostgreSQL schema
 """
 
+import hashlib
+import io
 import os
+import shutil
+import struct
 import subprocess
 import sys
 
+# Database configuration
+DB_CONFIG = {
+    'host': os.getenv('PGHOST', 'localhost'),
+    'port': os.getenv('PGPORT', '5432'),
+    'database': os.getenv('PGDATABASE', 'saas_analytics_demo'),
+    'user': os.getenv('PGUSER', 'saas_user'),
+    'password': os.getenv('PGPASSWORD', 'demo_password'),
+    # Fall back to the static ERD quickly when the server is unreachable
+    'connect_timeout': 5
+}
+
+# Header that starts every COPY ... (FORMAT binary) stream
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+# Records the signature of the schema the current diagrams were rendered from
+SIGNATURE_FILE = '.schema_diagram.sig'
+DIAGRAM_FILES = ('schema_diagram.png', 'schema_diagram.svg')
+# Graph with node and edge positions already computed by dot
+LAYOUT_FILE = 'schema_diagram.laid.dot'
+
+# Characters with special meaning inside a DOT record label
+DOT_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '"': '\\"',
+    '|': '\\|',
+    '{': '\\{',
+    '}': '\\}',
+    '<': '\\<',
+    '>': '\\>',
+})
+
+# Characters that must be escaped inside a quoted DOT identifier
+DOT_ID_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '"': '\\"',
+})
+
+# Static ERD of schema.sql, used when the live schema cannot be read
+STATIC_ERD_DOT = """digraph ERD {
+  rankdir=TB;
+  node [fontname="Arial", fontsize=10];
+  edge [fontname="Arial", fontsize=8];
+  
+  // Define table styling
+  node [shape=record, style=filled, fillcolor=lightblue];
+  
+  users [label="users|id UUID PK\\lemail VARCHAR(255)\\lcreated_at TIMESTAMP\\lactivated_at TIMESTAMP\\llast_login_at TIMESTAMP\\lstatus user_status\\lsignup_channel signup_channel\\lcountry_code VARCHAR(2)\\lutm_source VARCHAR(100)\\lutm_medium VARCHAR(100)\\lutm_campaign VARCHAR(100)\\lreferred_by_user_id UUID", shape=record];
+  
+  plans [label="plans|id SERIAL PK\\lname plan_type\\lprice_monthly DECIMAL(10,2)\\lprice_annual DECIMAL(10,2)\\lmax_projects INTEGER\\lmax_team_members INTEGER\\lfeatures JSONB", shape=record];
+  
+  subscriptions [label="subscriptions|id UUID PK\\luser_id UUID\\lplan_id INTEGER\\lstatus subscription_status\\lbilling_cycle billing_cycle\\lstarted_at TIMESTAMP\\lended_at TIMESTAMP\\lcancelled_at TIMESTAMP\\lmrr DECIMAL(10,2)\\lmrr_cents BIGINT\\lcreated_at TIMESTAMP", shape=record];
+  
+  projects [label="projects|id UUID PK\\luser_id UUID\\lname VARCHAR(255)\\lcreated_at TIMESTAMP\\lcompleted_at TIMESTAMP\\lis_active BOOLEAN", shape=record];
+  
+  tasks [label="tasks|id UUID PK\\lproject_id UUID\\luser_id UUID\\ltitle VARCHAR(500)\\lcreated_at TIMESTAMP\\lcompleted_at TIMESTAMP\\lis_completed BOOLEAN", shape=record];
+  
+  team_memberships [label="team_memberships|id UUID PK\\linviter_user_id UUID\\linvited_user_id UUID\\lproject_id UUID\\linvited_at TIMESTAMP\\laccepted_at TIMESTAMP\\lrole VARCHAR(50)", shape=record];
+  
+  revenue_events [label="revenue_events|id UUID PK\\luser_id UUID\\lsubscription_id UUID\\lamount DECIMAL(10,2)\\levent_type VARCHAR(50)\\loccurred_at TIMESTAMP PK\\lstripe_payment_id VARCHAR(255)", shape=record];
+  
+  user_activities [label="user_activities|id UUID PK\\luser_id UUID\\lactivity_type VARCHAR(100)\\lmetadata JSONB\\loccurred_at TIMESTAMP PK", shape=record];
+  
+  funnel_events [label="funnel_events|id UUID PK\\luser_id UUID\\levent_name VARCHAR(100)\\loccurred_at TIMESTAMP PK\\lsession_id VARCHAR(255)\\lpage_url VARCHAR(500)", shape=record];
+
+  // Define relationships
+  edge [arrowhead=crow];
+  
+  subscriptions -> users [label="user_id"];
+  subscriptions -> plans [label="plan_id"];
+  projects -> users [label="user_id"];
+  tasks -> projects [label="project_id"];
+  tasks -> users [label="user_id"];
+  team_memberships -> users [label="inviter_user_id"];
+  team_memberships -> users [label="invited_user_id"];
+  team_memberships -> projects [label="project_id"];
+  revenue_events -> users [label="user_id"];
+  revenue_events -> subscriptions [label="subscription_id"];
+  user_activities -> users [label="user_id"];
+  funnel_events -> users [label="user_id"];
+  users -> users [label="referred_by_user_id"];
+}"""
+
 
 def check_dependencies():
     """Check if required dependencies are installed"""
@@ -22,14 +108,9 @@ def check_dependencies():
         print("ℹ Will generate static ERD without database connection")
         has_psycopg2 = False
 
-    try:
-        result = subprocess.run(['dot', '-V'], capture_output=True, text=True)
-        if result.returncode == 0:
-            print("✓ Graphviz found")
-        else:
-            print("✗ Graphviz not found. Install with: apt-get install graphviz (Ubuntu) or brew install graphviz (Mac)")
-            has_graphviz = False
-    except FileNotFoundError:
+    if shutil.which('dot'):
+        print("✓ Graphviz found")
+    else:
         print("✗ Graphviz not found. Install with: apt-get install graphviz (Ubuntu) or brew install graphviz (Mac)")
         has_graphviz = False
 
@@ -41,43 +122,45 @@ def generate_erd_sql():
     return """
     WITH tables_info AS (
         SELECT 
-            t.table_name,
+            c.relname as table_name,
             string_agg(
-                c.column_name || ' ' || 
-                CASE 
-                    WHEN c.data_type = 'USER-DEFINED' THEN c.udt_name
-                    WHEN c.data_type = 'character varying' THEN 'varchar(' || c.character_maximum_length || ')'
-                    WHEN c.data_type = 'numeric' THEN 'decimal(' || c.numeric_precision || ',' || c.numeric_scale || ')'
-                    ELSE c.data_type 
-                END ||
-                CASE WHEN c.is_nullable = 'NO' THEN ' NOT NULL' ELSE '' END ||
-                CASE WHEN pk.column_name IS NOT NULL THEN ' PK' ELSE '' END,
+                a.attname || ' ' || pg_catalog.format_type(a.atttypid, a.atttypmod) ||
+                CASE WHEN a.attnotnull THEN ' NOT NULL' ELSE '' END ||
+                CASE WHEN pk.oid IS NOT NULL THEN ' PK' ELSE '' END,
                 '\\n'
-                ORDER BY c.ordinal_position
+                ORDER BY a.attnum
             ) as columns
-        FROM information_schema.tables t
-        JOIN information_schema.columns c ON t.table_name = c.table_name
-        LEFT JOIN (
-            SELECT ku.table_name, ku.column_name
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage ku ON tc.constraint_name = ku.constraint_name
-            WHERE tc.constraint_type = 'PRIMARY KEY'
-        ) pk ON c.table_name = pk.table_name AND c.column_name = pk.column_name
-        WHERE t.table_schema = 'public' 
-            AND t.table_type = 'BASE TABLE'
-            AND t.table_name NOT LIKE 'pg_%'
-        GROUP BY t.table_name
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON c.relnamespace = n.oid
+        JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+        LEFT JOIN pg_catalog.pg_constraint pk ON pk.conrelid = c.oid
+            AND pk.contype = 'p'
+            AND a.attnum = ANY(pk.conkey)
+        WHERE n.nspname = 'public'
+            AND c.relkind IN ('r', 'p', 'm')
+            AND NOT c.relispartition
+            AND a.attnum > 0
+            AND NOT a.attisdropped
+        GROUP BY c.relname
     ),
     relationships AS (
         SELECT DISTINCT
-            tc.table_name as from_table,
-            kcu.column_name as from_column,
-            ccu.table_name as to_table,
-            ccu.column_name as to_column
-        FROM information_schema.table_constraints tc
-        JOIN information_schema.key_column_usage kcu ON tc.constraint_name = kcu.constraint_name
-        JOIN information_schema.constraint_column_usage ccu ON ccu.constraint_name = tc.constraint_name
-        WHERE tc.constraint_type = 'FOREIGN KEY'
+            from_rel.relname as from_table,
+            from_att.attname as from_column,
+            to_rel.relname as to_table,
+            to_att.attname as to_column
+        FROM pg_catalog.pg_constraint fk
+        JOIN pg_catalog.pg_namespace n ON fk.connamespace = n.oid
+        CROSS JOIN LATERAL unnest(fk.conkey, fk.confkey) as k(from_attnum, to_attnum)
+        JOIN pg_catalog.pg_class from_rel ON from_rel.oid = fk.conrelid
+        JOIN pg_catalog.pg_class to_rel ON to_rel.oid = fk.confrelid
+        JOIN pg_catalog.pg_attribute from_att ON from_att.attrelid = fk.conrelid
+            AND from_att.attnum = k.from_attnum
+        JOIN pg_catalog.pg_attribute to_att ON to_att.attrelid = fk.confrelid
+            AND to_att.attnum = k.to_attnum
+        WHERE fk.contype = 'f'
+            AND n.nspname = 'public'
+            AND NOT from_rel.relispartition
     )
     SELECT 'TABLES' as type, table_name as name, columns as details FROM tables_info
     UNION ALL
@@ -89,24 +172,85 @@ def generate_erd_sql():
     """
 
 
+def parse_binary_copy(data):
+    """Decode a binary COPY stream of text columns into a list of tuples"""
+    if not data.startswith(COPY_SIGNATURE):
+        raise ValueError("Not a PostgreSQL binary COPY stream")
+
+    unpack_int16 = struct.Struct('!h').unpack_from
+    unpack_int32 = struct.Struct('!i').unpack_from
+
+    # Skip the flags field and any header extension
+    offset = len(COPY_SIGNATURE) + 4
+    offset += 4 + unpack_int32(data, offset)[0]
+
+    rows = []
+    while True:
+        field_count = unpack_int16(data, offset)[0]
+        offset += 2
+        if field_count == -1:
+            break
+
+        row = []
+        for _ in range(field_count):
+            length = unpack_int32(data, offset)[0]
+            offset += 4
+            if length == -1:
+                row.append(None)
+            else:
+                row.append(data[offset:offset + length].decode('utf-8'))
+                offset += length
+        rows.append(tuple(row))
+
+    return rows
+
+
+def fetch_schema_rows():
+    """Extract schema rows from the database, or None if it is unavailable"""
+    try:
+        import psycopg2
+    except ImportError:
+        return None
+
+    query = generate_erd_sql().strip().rstrip(';')
+    buf = io.BytesIO()
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+    except psycopg2.Error:
+        print("ℹ Database not reachable, using static ERD")
+        return None
+
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buf)
+    except psycopg2.Error as e:
+        print(f"✗ Schema extraction failed: {e}")
+        print("ℹ Using static ERD")
+        return None
+    finally:
+        conn.close()
+
+    return parse_binary_copy(buf.getvalue())
+
+
+def escape_dot(text):
+    """Escape characters that are special inside a DOT record label"""
+    return text.translate(DOT_ESCAPES)
+
+
+def quote_dot_id(name):
+    """Quote a relation name for use as a DOT node ID"""
+    return f'"{name.translate(DOT_ID_ESCAPES)}"'
+
+
 def generate_dot_content(schema_data):
     """Generate DOT notation for Graphviz"""
-    tables = []
-    relationships = []
-
-    for row in schema_data:
-        if row[0] == 'TABLES':
-            table_name = row[1]
-            columns = row[2].replace('\n', '\\l')
-            tables.append(
-                f'  {table_name} [label="{table_name}|{columns}\\l", shape=record];')
-        elif row[0] == 'RELATIONSHIPS':
-            rel_parts = row[1].split('->')
-            if len(rel_parts) == 2:
-                from_table, to_table = rel_parts
-                relationships.append(f'  {from_table} -> {to_table};')
+    buf = io.StringIO()
+    relationships = io.StringIO()
+    w = buf.write
 
-    dot_content = """digraph ERD {
+    w("""digraph ERD {
   rankdir=TB;
   node [fontname="Arial", fontsize=10];
   edge [fontname="Arial", fontsize=8];
@@ -114,15 +258,74 @@ def generate_dot_content(schema_data):
   // Define table styling
   node [shape=record, style=filled, fillcolor=lightblue];
   
-""" + '\n'.join(tables) + """
+""")
 
+    for row in schema_data:
+        if row[0] == 'TABLES':
+            table_name = row[1]
+            # Columns arrive separated by literal "\n"; left-justify each line
+            columns = '\\l'.join(
+                escape_dot(column)
+                for column in row[2].replace('\\n', '\n').split('\n'))
+            w(f'  {quote_dot_id(table_name)} [label="{escape_dot(table_name)}|{columns}\\l", shape=record];\n')
+        elif row[0] == 'RELATIONSHIPS':
+            rel_parts = row[1].split('->')
+            if len(rel_parts) == 2:
+                from_table, to_table = rel_parts
+                relationships.write(
+                    f'  {quote_dot_id(from_table)} -> {quote_dot_id(to_table)};\n')
+
+    w("""
   // Define relationships
   edge [arrowhead=crow];
   
-""" + '\n'.join(relationships) + """
-}"""
+""")
+    w(relationships.getvalue())
+    w("}")
+
+    return buf.getvalue()
 
-    return dot_content
+
+def schema_signature(dot_content):
+    """Return a hash identifying the schema described by the DOT content"""
+    return hashlib.blake2b(dot_content.encode()).hexdigest()
+
+
+def signature_matches(signature):
+    """Check whether the last rendered diagrams were built from this signature"""
+    try:
+        with open(SIGNATURE_FILE) as f:
+            return f.read().strip() == signature
+    except OSError:
+        return False
+
+
+def render_from_layout(paths):
+    """Render diagram files from the saved layout without laying out again"""
+    args = ['neato', '-n2']
+    for path in paths:
+        args += [f'-T{os.path.splitext(path)[1][1:]}', '-o', path]
+    subprocess.run(args + [LAYOUT_FILE], check=True)
+
+
+def write_dot_file(path, dot_content):
+    """Write the DOT source unless the file already holds the same content"""
+    data = dot_content.encode()
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    return True
 
 
 def main():
@@ -134,75 +337,58 @@ def main():
 
     print("\n📊 Generating Entity Relationship Diagram...")
 
-    # For demo purposes, we'll create a static ERD since we don't have a live database
-    # In a real scenario, you would connect to PostgreSQL and run the query
-
-    dot_content = """digraph ERD {
-  rankdir=TB;
-  node [fontname="Arial", fontsize=10];
-  edge [fontname="Arial", fontsize=8];
-  
-  // Define table styling
-  node [shape=record, style=filled, fillcolor=lightblue];
-  
-  users [label="users|id UUID PK\\lemail VARCHAR(255)\\lcreated_at TIMESTAMP\\lactivated_at TIMESTAMP\\llast_login_at TIMESTAMP\\lstatus user_status\\lsignup_channel signup_channel\\lcountry_code VARCHAR(2)\\lutm_source VARCHAR(100)\\lutm_medium VARCHAR(100)\\lutm_campaign VARCHAR(100)\\lreferred_by_user_id UUID", shape=record];
-  
-  plans [label="plans|id SERIAL PK\\lname plan_type\\lprice_monthly DECIMAL(10,2)\\lprice_annual DECIMAL(10,2)\\lmax_projects INTEGER\\lmax_team_members INTEGER\\lfeatures JSONB", shape=record];
-  
-  subscriptions [label="subscriptions|id UUID PK\\luser_id UUID\\lplan_id INTEGER\\lstatus subscription_status\\lbilling_cycle billing_cycle\\lstarted_at TIMESTAMP\\lended_at TIMESTAMP\\lcancelled_at TIMESTAMP\\lmrr DECIMAL(10,2)\\lcreated_at TIMESTAMP", shape=record];
-  
-  projects [label="projects|id UUID PK\\luser_id UUID\\lname VARCHAR(255)\\lcreated_at TIMESTAMP\\lcompleted_at TIMESTAMP\\lis_active BOOLEAN", shape=record];
-  
-  tasks [label="tasks|id UUID PK\\lproject_id UUID\\luser_id UUID\\ltitle VARCHAR(500)\\lcreated_at TIMESTAMP\\lcompleted_at TIMESTAMP\\lis_completed BOOLEAN", shape=record];
-  
-  team_memberships [label="team_memberships|id UUID PK\\linviter_user_id UUID\\linvited_user_id UUID\\lproject_id UUID\\linvited_at TIMESTAMP\\laccepted_at TIMESTAMP\\lrole VARCHAR(50)", shape=record];
-  
-  revenue_events [label="revenue_events|id UUID PK\\luser_id UUID\\lsubscription_id UUID\\lamount DECIMAL(10,2)\\levent_type VARCHAR(50)\\loccurred_at TIMESTAMP\\lstripe_payment_id VARCHAR(255)", shape=record];
-  
-  user_activities [label="user_activities|id UUID PK\\luser_id UUID\\lactivity_type VARCHAR(100)\\lmetadata JSONB\\loccurred_at TIMESTAMP", shape=record];
-  
-  funnel_events [label="funnel_events|id UUID PK\\luser_id UUID\\levent_name VARCHAR(100)\\loccurred_at TIMESTAMP\\lsession_id VARCHAR(255)\\lpage_url VARCHAR(500)", shape=record];
+    # Use the live schema when the database is reachable, else the static ERD
+    schema_rows = fetch_schema_rows()
+    if schema_rows:
+        dot_content = generate_dot_content(schema_rows)
+        print("✓ Read schema from database")
+    else:
+        dot_content = STATIC_ERD_DOT
 
-  // Define relationships
-  edge [arrowhead=crow];
-  
-  subscriptions -> users [label="user_id"];
-  subscriptions -> plans [label="plan_id"];
-  projects -> users [label="user_id"];
-  tasks -> projects [label="project_id"];
-  tasks -> users [label="user_id"];
-  team_memberships -> users [label="inviter_user_id"];
-  team_memberships -> users [label="invited_user_id"];
-  team_memberships -> projects [label="project_id"];
-  revenue_events -> users [label="user_id"];
-  revenue_events -> subscriptions [label="subscription_id"];
-  user_activities -> users [label="user_id"];
-  funnel_events -> users [label="user_id"];
-  users -> users [label="referred_by_user_id"];
-}"""
+    # Written before the signature check so a deleted source file is restored
+    # even when the rendered diagrams are current; identical content is skipped
+    if write_dot_file('schema_diagram.dot', dot_content):
+        print("✓ Generated schema_diagram.dot")
+    else:
+        print("✓ schema_diagram.dot already up to date")
 
-    # Write DOT file
-    with open('schema_diagram.dot', 'w') as f:
-        f.write(dot_content)
+    signature = schema_signature(dot_content)
+    if signature_matches(signature):
+        missing = [path for path in DIAGRAM_FILES if not os.path.exists(path)]
+        if not missing:
+            print("✓ Schema unchanged, existing diagrams are up to date")
+            return
 
-    print("✓ Generated schema_diagram.dot")
+        # Same schema, so only render the missing outputs from the saved
+        # layout; fall back to a full render if that fails
+        if os.path.exists(LAYOUT_FILE):
+            try:
+                render_from_layout(missing)
+                for path in missing:
+                    print(f"✓ Regenerated {path} from saved layout")
+                return
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                pass
 
-    # Generate PNG using Graphviz
+    # Generate PNG, SVG (for web viewing) and the laid-out graph with a single
+    # Graphviz run so the graph is parsed and laid out only once
     try:
-        subprocess.run(['dot', '-Tpng', 'schema_diagram.dot',
-                       '-o', 'schema_diagram.png'], check=True)
+        subprocess.run(['dot', '-Tpng', '-o', 'schema_diagram.png',
+                        '-Tsvg', '-o', 'schema_diagram.svg',
+                        '-Tdot', '-o', LAYOUT_FILE,
+                        'schema_diagram.dot'], check=True)
         print("✓ Generated schema_diagram.png")
-
-        # Generate SVG for web viewing
-        subprocess.run(['dot', '-Tsvg', 'schema_diagram.dot',
-                       '-o', 'schema_diagram.svg'], check=True)
         print("✓ Generated schema_diagram.svg")
 
+        with open(SIGNATURE_FILE, 'w') as f:
+            f.write(signature)
+
         print("\n🎉 Schema diagrams generated successfully!")
         print("📁 Files created:")
         print("   - schema_diagram.dot (Graphviz source)")
         print("   - schema_diagram.png (Image)")
         print("   - schema_diagram.svg (Scalable vector)")
+        print(f"   - {LAYOUT_FILE} (Precomputed layout)")
 
     except subprocess.CalledProcessError as e:
         print(f"✗ Error generating diagram: {e}")
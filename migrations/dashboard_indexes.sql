@@ -0,0 +1,58 @@
+-- Indexes supporting the dashboard's time-windowed predicates
+-- Partial indexes match the WHERE clauses of the dashboard queries exactly.
+-- users(created_at), subscriptions(started_at) and projects(created_at) are
+-- already covered by the btree indexes in schema.sql.
+--
+-- Built CONCURRENTLY so they can be added to a live database without blocking
+-- writes; run outside a transaction:
+--   psql -U saas_user -d saas_analytics_demo -f migrations/dashboard_indexes.sql
+
+-- Revenue by plan (payments in the last 30 days)
+-- revenue_events is partitioned in schema.sql, and a partitioned parent cannot
+-- be indexed CONCURRENTLY. There the parent index is created ON ONLY, each
+-- partition's index is built concurrently and then attached. Databases created
+-- before partitioning get a plain concurrent build. Uses psql's \gexec.
+SELECT 'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_revenue_events_payments_occurred_at
+    ON revenue_events(occurred_at) WHERE event_type = ''payment'''
+WHERE (SELECT relkind FROM pg_class WHERE oid = 'revenue_events'::regclass) = 'r'
+\gexec
+
+SELECT 'CREATE INDEX IF NOT EXISTS idx_revenue_events_payments_occurred_at
+    ON ONLY revenue_events(occurred_at) WHERE event_type = ''payment'''
+WHERE (SELECT relkind FROM pg_class WHERE oid = 'revenue_events'::regclass) = 'p'
+\gexec
+
+-- Partitions without an index attached to the parent index yet
+CREATE TEMP VIEW revenue_event_partitions_to_index AS
+SELECT n.nspname, c.relname, c.relname || '_payments_occurred_at_idx' as index_name
+FROM pg_inherits inh
+JOIN pg_class c ON c.oid = inh.inhrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE inh.inhparent = 'revenue_events'::regclass
+    AND NOT EXISTS (
+        SELECT 1
+        FROM pg_inherits idx_inh
+        JOIN pg_index i ON i.indexrelid = idx_inh.inhrelid
+        WHERE idx_inh.inhparent = 'idx_revenue_events_payments_occurred_at'::regclass
+            AND i.indrelid = c.oid
+    );
+
+SELECT format('CREATE INDEX CONCURRENTLY IF NOT EXISTS %I ON %I.%I(occurred_at) WHERE event_type = ''payment''',
+              index_name, nspname, relname)
+FROM revenue_event_partitions_to_index
+\gexec
+
+SELECT format('ALTER INDEX idx_revenue_events_payments_occurred_at ATTACH PARTITION %I.%I',
+              nspname, index_name)
+FROM revenue_event_partitions_to_index
+\gexec
+
+DROP VIEW revenue_event_partitions_to_index;
+
+-- New paid subscriptions in the last 7 days
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subscriptions_paid_started_at
+    ON subscriptions(started_at) WHERE plan_id != 1;
+
+-- Cancelled subscriptions in the last 7 days
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_subscriptions_cancelled_at
+    ON subscriptions(cancelled_at) WHERE status = 'cancelled';
@@ -0,0 +1,119 @@
+-- Materialized views backing quick_dashboard.py
+-- Pre-computes the dashboard's recurring aggregations so each run reads a
+-- handful of rows instead of re-scanning users, subscriptions and revenue_events.
+--
+-- Apply after schema.sql and sample_data.sql (and, on databases created
+-- before subscriptions.mrr_cents existed, migrations/subscriptions_mrr_cents.sql):
+--   psql -U saas_user -d saas_analytics_demo -f migrations/mv_dashboard.sql
+--
+-- Refresh on demand with:
+--   SELECT refresh_dashboard_views();
+
+DROP MATERIALIZED VIEW IF EXISTS mv_kpi_snapshot;
+DROP MATERIALIZED VIEW IF EXISTS mv_plan_revenue_30d;
+DROP MATERIALIZED VIEW IF EXISTS mv_user_growth_6m;
+DROP MATERIALIZED VIEW IF EXISTS mv_channel_perf_90d;
+
+-- Headline KPIs (single row), computed in one pass over each table
+CREATE MATERIALIZED VIEW mv_kpi_snapshot AS
+WITH user_totals AS (
+    SELECT 
+        COUNT(*) FILTER (WHERE u.status = 'active') as active_users,
+        COUNT(*) as total_users,
+        -- Semi-join: stops at the first active paid subscription per user
+        COUNT(*) FILTER (WHERE EXISTS (
+            SELECT 1 FROM subscriptions s
+            WHERE s.user_id = u.id AND s.status = 'active' AND s.plan_id != 1
+        )) as paid_users
+    FROM users u
+),
+subscription_totals AS (
+    SELECT 
+        COUNT(*) FILTER (WHERE status = 'active' AND plan_id != 1) as paid_subscribers,
+        -- Annual amounts are divided once over the total so per-row
+        -- remainders are not truncated away
+        ROUND((12 * COALESCE(SUM(mrr_cents) FILTER (
+                    WHERE status = 'active' AND billing_cycle IS DISTINCT FROM 'annual'), 0)
+               + COALESCE(SUM(mrr_cents) FILTER (
+                    WHERE status = 'active' AND billing_cycle = 'annual'), 0))
+              / 12.0)::bigint as total_mrr_cents
+    FROM subscriptions
+)
+SELECT 
+    CURRENT_TIMESTAMP as refreshed_at,
+    ut.active_users,
+    st.paid_subscribers,
+    st.total_mrr_cents,
+    ut.paid_users * 100.0 / NULLIF(ut.total_users, 0) as conversion_rate
+FROM user_totals ut, subscription_totals st;
+
+CREATE UNIQUE INDEX idx_mv_kpi_snapshot_refreshed_at ON mv_kpi_snapshot(refreshed_at);
+
+-- Revenue by plan over the last 30 days
+CREATE MATERIALIZED VIEW mv_plan_revenue_30d AS
+SELECT 
+    p.name as plan,
+    COUNT(re.id) as transactions,
+    SUM(re.amount) as revenue
+FROM revenue_events re
+JOIN subscriptions s ON re.subscription_id = s.id
+JOIN plans p ON s.plan_id = p.id
+WHERE re.occurred_at >= CURRENT_DATE - INTERVAL '30 days'
+    AND re.event_type = 'payment'
+GROUP BY p.name;
+
+CREATE UNIQUE INDEX idx_mv_plan_revenue_30d_plan ON mv_plan_revenue_30d(plan);
+
+-- Monthly signups and activations over the last 6 months
+CREATE MATERIALIZED VIEW mv_user_growth_6m AS
+SELECT 
+    DATE_TRUNC('month', created_at) as month,
+    COUNT(*) as new_users,
+    COUNT(CASE WHEN activated_at IS NOT NULL THEN 1 END) as activated_users,
+    ROUND(COUNT(CASE WHEN activated_at IS NOT NULL THEN 1 END) * 100.0 / NULLIF(COUNT(*), 0), 1) as activation_rate
+FROM users 
+WHERE created_at >= CURRENT_DATE - INTERVAL '6 months'
+GROUP BY DATE_TRUNC('month', created_at);
+
+CREATE UNIQUE INDEX idx_mv_user_growth_6m_month ON mv_user_growth_6m(month);
+
+-- Acquisition channel performance over the last 90 days
+CREATE MATERIALIZED VIEW mv_channel_perf_90d AS
+SELECT 
+    u.signup_channel,
+    COUNT(u.id) as total_signups,
+    COUNT(CASE WHEN s.plan_id != 1 THEN 1 END) as paid_conversions,
+    ROUND(COUNT(CASE WHEN s.plan_id != 1 THEN 1 END) * 100.0 / COUNT(u.id), 2) as conversion_rate
+FROM users u
+LEFT JOIN subscriptions s ON u.id = s.user_id AND s.status = 'active'
+WHERE u.created_at >= CURRENT_DATE - INTERVAL '90 days'
+GROUP BY u.signup_channel
+HAVING COUNT(u.id) >= 5;
+
+CREATE UNIQUE INDEX idx_mv_channel_perf_90d_channel ON mv_channel_perf_90d(signup_channel);
+
+-- Refresh all dashboard views without blocking readers
+CREATE OR REPLACE FUNCTION refresh_dashboard_views()
+RETURNS void AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_kpi_snapshot;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_plan_revenue_30d;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_user_growth_6m;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_channel_perf_90d;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Schedule an hourly refresh when pg_cron is installed in this database.
+-- pg_cron needs shared_preload_libraries and superuser rights, so it is not
+-- created here; without it, call refresh_dashboard_views() from an external
+-- scheduler instead.
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('refresh-dashboard-views', '0 * * * *',
+                              'SELECT refresh_dashboard_views()');
+    ELSE
+        RAISE NOTICE 'pg_cron not installed; schedule SELECT refresh_dashboard_views() externally';
+    END IF;
+END
+$$;
@@ -0,0 +1,8 @@
+-- Add subscriptions.mrr_cents to databases created before it was in schema.sql
+-- MRR is kept as integer cents so aggregates use int8 arithmetic instead of
+-- arbitrary-precision numeric; convert back to dollars only for display.
+--
+--   psql -U saas_user -d saas_analytics_demo -f migrations/subscriptions_mrr_cents.sql
+
+ALTER TABLE subscriptions
+    ADD COLUMN IF NOT EXISTS mrr_cents BIGINT GENERATED ALWAYS AS ((mrr * 100)::BIGINT) STORED;
@@ -4,251 +4,286 @@ Quick Analytics Dashboard
 Generates key SaaS metrics from the database and displays them in a formatted report
 """
 
+import io
 import os
 import sys
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone
 
 try:
-    import psycopg2
-    from psycopg2.extras import RealDictCursor
+    import psycopg
+    from psycopg.rows import namedtuple_row
+    from psycopg_pool import ConnectionPool
 except ImportError:
-    print("❌ psycopg2 not found. Install with: pip install psycopg2-binary")
+    print("❌ psycopg not found. Install with: pip install \"psycopg[binary,pool]\"")
     sys.exit(1)
 
 # Database configuration
 DB_CONFIG = {
     'host': os.getenv('PGHOST', 'localhost'),
     'port': os.getenv('PGPORT', '5432'),
-    'database': os.getenv('PGDATABASE', 'saas_analytics_demo'),
+    'dbname': os.getenv('PGDATABASE', 'saas_analytics_demo'),
     'user': os.getenv('PGUSER', 'saas_user'),
-    'password': os.getenv('PGPASSWORD', 'demo_password')
+    'password': os.getenv('PGPASSWORD', 'demo_password'),
+    # Keep idle pooled connections alive so a long-running caller can reuse them
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    # Give up quickly when the server is unreachable
+    'connect_timeout': 5
 }
 
+# Snapshot views are expected to be refreshed at least this often
+# (hourly via pg_cron, see migrations/mv_dashboard.sql), plus a margin for
+# the refresh itself to finish after the job fires
+SNAPSHOT_MAX_AGE = timedelta(hours=1, minutes=5)
+
+# Connection pool, created on first use
+POOL = None
+POOL_LOCK = threading.Lock()
+
+# Scalar metrics are independent of each other, so they are fetched in a
+# single query. Headline KPIs come from the pre-computed snapshot (see
+# migrations/mv_dashboard.sql); recent activity is counted live.
+METRICS_QUERY = """
+    SELECT
+        k.refreshed_at,
+        k.active_users,
+        k.paid_subscribers,
+        k.total_mrr_cents,
+        k.conversion_rate,
+        (SELECT COUNT(*) FROM users 
+            WHERE created_at >= CURRENT_DATE - %(window)s) as recent_signups,
+        (SELECT COUNT(*) FROM subscriptions 
+            WHERE plan_id != 1 AND started_at >= CURRENT_DATE - %(window)s) as recent_upgrades,
+        (SELECT COUNT(*) FROM subscriptions 
+            WHERE status = 'cancelled' AND cancelled_at >= CURRENT_DATE - %(window)s) as recent_churn,
+        (SELECT COUNT(*) FROM projects 
+            WHERE created_at >= CURRENT_DATE - %(window)s) as projects_created
+    FROM mv_kpi_snapshot k
+"""
 
-def connect_db():
-    """Connect to the PostgreSQL database"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except psycopg2.Error as e:
-        print(f"❌ Database connection failed: {e}")
-        print("\nTry running: ./setup_database.sh")
-        sys.exit(1)
+PLAN_REVENUE_QUERY = """
+    SELECT plan, transactions, revenue
+    FROM mv_plan_revenue_30d
+    ORDER BY revenue DESC
+"""
 
+USER_GROWTH_QUERY = """
+    SELECT month, new_users, activated_users, activation_rate
+    FROM mv_user_growth_6m
+    ORDER BY month DESC
+    LIMIT 6
+"""
+
+CHANNEL_PERFORMANCE_QUERY = """
+    SELECT signup_channel, total_signups, paid_conversions, conversion_rate
+    FROM mv_channel_perf_90d
+    ORDER BY conversion_rate DESC
+"""
 
-def execute_query(conn, query, description=""):
-    """Execute a query and return results"""
+# Report formatters, bound once at import instead of per call
+CURRENCY_FORMAT = "${:,.2f}".format
+PERCENTAGE_FORMAT = "{:.2f}%".format
+NUMBER_FORMAT = "{:,d}".format
+METRIC_LINE = "  {:<35} {}{}\n".format
+SECTION_HEADER = f"\n{'='*60}\n📊 {{}}\n{'='*60}\n".format
+
+
+def get_pool():
+    """Return the shared connection pool, creating it on first use"""
+    global POOL
+    with POOL_LOCK:
+        if POOL is None:
+            # The pool retries failed connections in the background; connect
+            # once directly so a bad host or password fails at once with the
+            # real libpq error
+            psycopg.connect(**DB_CONFIG).close()
+            pool = ConnectionPool(kwargs=DB_CONFIG, min_size=1, max_size=4,
+                                  open=True)
+            pool.wait(timeout=10)
+            POOL = pool
+        return POOL
+
+
+def execute_queries(conn, report, queries):
+    """Send queries back-to-back in one pipeline and return each result set
+
+    Each query is a (description, query, params) tuple. Statements are
+    prepared server-side, so a pooled connection reuses their plans.
+    Failures are recorded in the report.
+    """
+    pending = []
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
-            return cur.fetchall()
-    except psycopg2.Error as e:
-        print(f"❌ Query failed ({description}): {e}")
-        return []
+        with conn.pipeline():
+            for description, query, params in queries:
+                cur = conn.cursor(row_factory=namedtuple_row)
+                cur.execute(query, params, prepare=True)
+                pending.append(cur)
+        return [cur.fetchall() for cur in pending]
+    except psycopg.Error as e:
+        descriptions = ", ".join(description for description, _, _ in queries)
+        report.error(f"❌ Query failed ({descriptions}): {e}")
+        report.error("\nTry running: ./setup_database.sh")
+        return [[] for _ in queries]
 
 
 def format_currency(amount):
     """Format currency values"""
-    if amount is None:
-        return "$0.00"
-    return f"${float(amount):,.2f}"
+    return CURRENCY_FORMAT(amount or 0)
 
 
 def format_percentage(value):
     """Format percentage values"""
-    if value is None:
-        return "0.00%"
-    return f"{float(value):.2f}%"
+    return PERCENTAGE_FORMAT(value or 0)
 
 
 def format_number(value):
     """Format numeric values"""
-    if value is None:
-        return "0"
-    return f"{int(value):,}"
+    return NUMBER_FORMAT(value or 0)
 
 
-def print_header(title):
-    """Print a formatted section header"""
-    print(f"\n{'='*60}")
-    print(f"📊 {title}")
-    print(f"{'='*60}")
+class Report:
+    """Dashboard output collected in memory and written to stdout at once"""
 
+    def __init__(self):
+        self._buf = io.StringIO()
+        self.failed = False
 
-def print_metric(label, value, unit=""):
-    """Print a formatted metric"""
-    print(f"  {label:<35} {value}{unit}")
+    def line(self, text=""):
+        """Add a line of text"""
+        self._buf.write(f"{text}\n")
+
+    def header(self, title):
+        """Add a formatted section header"""
+        self._buf.write(SECTION_HEADER(title))
+
+    def metric(self, label, value, unit=""):
+        """Add a formatted metric"""
+        self._buf.write(METRIC_LINE(label, value, unit))
+
+    def error(self, text):
+        """Add an error message and mark the report as failed"""
+        self.failed = True
+        self.line(text)
+
+    def getvalue(self):
+        """Return the report text"""
+        return self._buf.getvalue()
 
 
 def generate_dashboard():
     """Generate the main analytics dashboard"""
-    print("🚀 SaaS Analytics Dashboard")
-    print(f"Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    report = Report()
+    report.line("🚀 SaaS Analytics Dashboard")
+    report.line(f"Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    # The pool context commits the read transaction before returning the
+    # connection, so it goes back idle rather than being rolled back
+    try:
+        with get_pool().connection() as conn:
+            add_report_sections(conn, report)
+    except psycopg.Error as e:
+        # Nothing useful to report without a connection
+        sys.stderr.write(f"❌ Database connection failed: {e}\n"
+                         "\nTry running: ./setup_database.sh\n")
+        sys.exit(1)
 
-    conn = connect_db()
+    report.line(f"\n{'='*60}")
+    if report.failed:
+        report.line("❌ Dashboard is incomplete; see errors above.")
+    else:
+        report.line("✅ Dashboard generated successfully!")
+    report.line("\n💡 Tips:")
+    report.line("  • Run analytics queries in analytics_queries.sql for detailed analysis")
+    report.line("  • Refresh cached metrics with: SELECT refresh_dashboard_views();")
+    report.line("  • Check schema_diagram.png for database structure")
+    report.line("  • Use pgAdmin or psql for interactive querying")
+    report.line(f"{'='*60}\n")
+
+    sys.stdout.write(report.getvalue())
+    sys.stdout.flush()
+
+
+def add_report_sections(conn, report):
+    """Query the dashboard metrics and add each section to the report"""
+    metrics, plan_revenue, growth_data, channel_data = execute_queries(conn, report, [
+        ("Key metrics", METRICS_QUERY, {'window': timedelta(days=7)}),
+        ("Plan revenue", PLAN_REVENUE_QUERY, None),
+        ("User growth", USER_GROWTH_QUERY, None),
+        ("Channel performance", CHANNEL_PERFORMANCE_QUERY, None),
+    ])
+    metrics = metrics[0]._asdict() if metrics else {}
 
     # Key Metrics Overview
-    print_header("Key Metrics Overview")
-
-    # Active users
-    active_users = execute_query(conn, """
-        SELECT COUNT(*) as count FROM users WHERE status = 'active'
-    """, "Active users")
-    print_metric("Active Users", format_number(
-        active_users[0]['count'] if active_users else 0))
-
-    # Paid subscribers
-    paid_subs = execute_query(conn, """
-        SELECT COUNT(*) as count FROM subscriptions 
-        WHERE status = 'active' AND plan_id != 1
-    """, "Paid subscribers")
-    print_metric("Paid Subscribers", format_number(
-        paid_subs[0]['count'] if paid_subs else 0))
-
-    # Current MRR
-    mrr = execute_query(conn, """
-        SELECT SUM(CASE 
-            WHEN billing_cycle = 'monthly' THEN mrr
-            WHEN billing_cycle = 'annual' THEN mrr / 12
-            ELSE mrr
-        END) as total_mrr
-        FROM subscriptions 
-        WHERE status = 'active'
-    """, "Current MRR")
-    mrr_value = mrr[0]['total_mrr'] if mrr and mrr[0]['total_mrr'] else 0
-    print_metric("Monthly Recurring Revenue", format_currency(mrr_value))
-    print_metric("Annual Recurring Revenue",
-                 format_currency(float(mrr_value) * 12))
-
-    # Conversion rate
-    conversion = execute_query(conn, """
-        WITH conversion_data AS (
-            SELECT 
-                COUNT(DISTINCT u.id) as total_users,
-                COUNT(DISTINCT CASE WHEN s.plan_id != 1 THEN u.id END) as paid_users
-            FROM users u
-            LEFT JOIN subscriptions s ON u.id = s.user_id AND s.status = 'active'
-        )
-        SELECT 
-            paid_users * 100.0 / NULLIF(total_users, 0) as conversion_rate
-        FROM conversion_data
-    """, "Conversion rate")
-    conv_rate = conversion[0]['conversion_rate'] if conversion and conversion[0]['conversion_rate'] else 0
-    print_metric("Free-to-Paid Conversion", format_percentage(conv_rate))
+    report.header("Key Metrics Overview")
+
+    report.metric("Active Users", format_number(metrics.get('active_users')))
+    report.metric("Paid Subscribers",
+                  format_number(metrics.get('paid_subscribers')))
+
+    # MRR is aggregated in integer cents; convert to dollars for display
+    mrr_value = (metrics.get('total_mrr_cents') or 0) / 100
+    report.metric("Monthly Recurring Revenue", format_currency(mrr_value))
+    report.metric("Annual Recurring Revenue",
+                  format_currency(mrr_value * 12))
+
+    report.metric("Free-to-Paid Conversion",
+                  format_percentage(metrics.get('conversion_rate')))
+    refreshed_at = metrics.get('refreshed_at')
+    if refreshed_at:
+        # Without a scheduler the views are never refreshed, so the 30-day,
+        # 6-month and 90-day sections below may describe an older window
+        snapshot_age = datetime.now(timezone.utc) - refreshed_at
+        stale = snapshot_age > SNAPSHOT_MAX_AGE
+        report.metric("Snapshot Refreshed At",
+                      refreshed_at.astimezone().strftime('%Y-%m-%d %H:%M:%S'),
+                      f" ⚠️  STALE ({snapshot_age.days}d "
+                      f"{snapshot_age.seconds // 3600}h old)" if stale else "")
+        if stale:
+            report.line("  ⚠️  Snapshot-based sections below are out of date; "
+                        "run SELECT refresh_dashboard_views();")
 
     # Revenue by Plan
-    print_header("Revenue by Plan (Last 30 Days)")
-
-    plan_revenue = execute_query(conn, """
-        SELECT 
-            p.name as plan,
-            COUNT(re.id) as transactions,
-            SUM(re.amount) as revenue
-        FROM revenue_events re
-        JOIN subscriptions s ON re.subscription_id = s.id
-        JOIN plans p ON s.plan_id = p.id
-        WHERE re.occurred_at >= CURRENT_DATE - INTERVAL '30 days'
-            AND re.event_type = 'payment'
-        GROUP BY p.name
-        ORDER BY revenue DESC
-    """, "Plan revenue")
+    report.header("Revenue by Plan (Last 30 Days)")
 
     for row in plan_revenue:
-        plan_name = row['plan'].title()
-        transactions = format_number(row['transactions'])
-        revenue = format_currency(row['revenue'])
-        print_metric(f"{plan_name} Plan",
-                     f"{revenue} ({transactions} transactions)")
+        plan_name = row.plan.title()
+        transactions = format_number(row.transactions)
+        revenue = format_currency(row.revenue)
+        report.metric(f"{plan_name} Plan",
+                      f"{revenue} ({transactions} transactions)")
 
     # User Growth
-    print_header("User Growth (Last 6 Months)")
-
-    growth_data = execute_query(conn, """
-        SELECT 
-            DATE_TRUNC('month', created_at) as month,
-            COUNT(*) as new_users,
-            COUNT(CASE WHEN activated_at IS NOT NULL THEN 1 END) as activated_users
-        FROM users 
-        WHERE created_at >= CURRENT_DATE - INTERVAL '6 months'
-        GROUP BY DATE_TRUNC('month', created_at)
-        ORDER BY month DESC
-        LIMIT 6
-    """, "User growth")
+    report.header("User Growth (Last 6 Months)")
 
     for row in growth_data:
-        month = row['month'].strftime('%Y-%m')
-        new_users = format_number(row['new_users'])
-        activated = format_number(row['activated_users'])
-        activation_rate = (
-            row['activated_users'] / row['new_users'] * 100) if row['new_users'] > 0 else 0
-        print_metric(
-            f"{month}", f"{new_users} signups, {activated} activated ({activation_rate:.1f}%)")
+        month = row.month.strftime('%Y-%m')
+        new_users = format_number(row.new_users)
+        activated = format_number(row.activated_users)
+        report.metric(
+            f"{month}", f"{new_users} signups, {activated} activated ({row.activation_rate}%)")
 
     # Top Performing Channels
-    print_header("Top Performing Acquisition Channels")
-
-    channel_data = execute_query(conn, """
-        SELECT 
-            u.signup_channel,
-            COUNT(u.id) as total_signups,
-            COUNT(CASE WHEN s.plan_id != 1 THEN 1 END) as paid_conversions,
-            ROUND(COUNT(CASE WHEN s.plan_id != 1 THEN 1 END) * 100.0 / COUNT(u.id), 2) as conversion_rate
-        FROM users u
-        LEFT JOIN subscriptions s ON u.id = s.user_id AND s.status = 'active'
-        WHERE u.created_at >= CURRENT_DATE - INTERVAL '90 days'
-        GROUP BY u.signup_channel
-        HAVING COUNT(u.id) >= 5
-        ORDER BY conversion_rate DESC
-    """, "Channel performance")
+    report.header("Top Performing Acquisition Channels")
 
     for row in channel_data:
-        channel = row['signup_channel'].replace('_', ' ').title()
-        signups = format_number(row['total_signups'])
-        conversions = format_number(row['paid_conversions'])
-        rate = format_percentage(row['conversion_rate'])
-        print_metric(
+        channel = row.signup_channel.replace('_', ' ').title()
+        signups = format_number(row.total_signups)
+        conversions = format_number(row.paid_conversions)
+        rate = format_percentage(row.conversion_rate)
+        report.metric(
             f"{channel}", f"{signups} signups → {conversions} paid ({rate})")
 
     # Recent Activity
-    print_header("Recent Activity (Last 7 Days)")
-
-    recent_signups = execute_query(conn, """
-        SELECT COUNT(*) as count FROM users 
-        WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-    """, "Recent signups")
-    print_metric("New Signups", format_number(
-        recent_signups[0]['count'] if recent_signups else 0))
-
-    recent_upgrades = execute_query(conn, """
-        SELECT COUNT(*) as count FROM subscriptions 
-        WHERE plan_id != 1 AND started_at >= CURRENT_DATE - INTERVAL '7 days'
-    """, "Recent upgrades")
-    print_metric("New Paid Subscriptions", format_number(
-        recent_upgrades[0]['count'] if recent_upgrades else 0))
-
-    recent_churn = execute_query(conn, """
-        SELECT COUNT(*) as count FROM subscriptions 
-        WHERE status = 'cancelled' AND cancelled_at >= CURRENT_DATE - INTERVAL '7 days'
-    """, "Recent churn")
-    print_metric("Cancelled Subscriptions", format_number(
-        recent_churn[0]['count'] if recent_churn else 0))
-
-    projects_created = execute_query(conn, """
-        SELECT COUNT(*) as count FROM projects 
-        WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-    """, "Projects created")
-    print_metric("Projects Created", format_number(
-        projects_created[0]['count'] if projects_created else 0))
-
-    conn.close()
-
-    print(f"\n{'='*60}")
-    print("✅ Dashboard generated successfully!")
-    print("\n💡 Tips:")
-    print("  • Run analytics queries in analytics_queries.sql for detailed analysis")
-    print("  • Check schema_diagram.png for database structure")
-    print("  • Use pgAdmin or psql for interactive querying")
-    print(f"{'='*60}\n")
+    report.header("Recent Activity (Last 7 Days)")
+
+    report.metric("New Signups", format_number(metrics.get('recent_signups')))
+    report.metric("New Paid Subscriptions",
+                  format_number(metrics.get('recent_upgrades')))
+    report.metric("Cancelled Subscriptions",
+                  format_number(metrics.get('recent_churn')))
+    report.metric("Projects Created",
+                  format_number(metrics.get('projects_created')))
 
 
 if __name__ == "__main__":
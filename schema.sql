@@ -49,6 +49,7 @@ CREATE TABLE subscriptions (
     ended_at TIMESTAMP WITH TIME ZONE,
     cancelled_at TIMESTAMP WITH TIME ZONE,
     mrr DECIMAL(10,2) NOT NULL DEFAULT 0, -- Monthly Recurring Revenue
+    mrr_cents BIGINT GENERATED ALWAYS AS ((mrr * 100)::BIGINT) STORED, -- MRR in integer cents for fast aggregation
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -84,35 +85,113 @@ CREATE TABLE team_memberships (
     role VARCHAR(50) DEFAULT 'member'
 );
 
+-- Event tables below are range-partitioned by month on occurred_at so
+-- time-windowed queries only scan the partitions they need. The partition key
+-- must be part of the primary key.
+
 -- Revenue events - for tracking all revenue-related events
 CREATE TABLE revenue_events (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id),
     subscription_id UUID NOT NULL REFERENCES subscriptions(id),
     amount DECIMAL(10,2) NOT NULL,
     event_type VARCHAR(50) NOT NULL, -- 'payment', 'refund', 'upgrade', 'downgrade'
-    occurred_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    stripe_payment_id VARCHAR(255) -- External payment processor reference
-);
+    occurred_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    stripe_payment_id VARCHAR(255), -- External payment processor reference
+    PRIMARY KEY (id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
 
 -- User activity events - for engagement tracking
 CREATE TABLE user_activities (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id),
     activity_type VARCHAR(100) NOT NULL, -- 'login', 'project_created', 'task_created', 'team_invite_sent', etc.
     metadata JSONB, -- Store additional activity data
-    occurred_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
+    occurred_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
 
 -- Funnel events - for conversion tracking
 CREATE TABLE funnel_events (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id),
     event_name VARCHAR(100) NOT NULL, -- 'signup', 'email_verified', 'onboarding_completed', 'first_project_created', 'payment_page_viewed', 'subscription_created'
-    occurred_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    occurred_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
     session_id VARCHAR(255),
-    page_url VARCHAR(500)
-);
+    page_url VARCHAR(500),
+    PRIMARY KEY (id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
+
+-- Catch-all partitions for rows outside the monthly ranges
+CREATE TABLE revenue_events_default PARTITION OF revenue_events DEFAULT;
+CREATE TABLE user_activities_default PARTITION OF user_activities DEFAULT;
+CREATE TABLE funnel_events_default PARTITION OF funnel_events DEFAULT;
+
+-- Function to create monthly event partitions, from months_back months before
+-- the current month to months_ahead months after it.
+-- Rows for a month that has no partition yet land in the DEFAULT partition,
+-- and a range overlapping those rows cannot be added. Each new partition is
+-- therefore created standalone, the month's rows are moved into it from the
+-- DEFAULT partition, and only then is it attached.
+CREATE OR REPLACE FUNCTION create_event_partitions(months_back INTEGER DEFAULT 0, months_ahead INTEGER DEFAULT 3)
+RETURNS void AS $$
+DECLARE
+    parent TEXT;
+    partition_name TEXT;
+    month_start DATE;
+    month_end DATE;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['revenue_events', 'user_activities', 'funnel_events'] LOOP
+        -- Separate sub-transaction per table, so a failure for one table does
+        -- not stop partitions being created for the others
+        BEGIN
+            FOR month_start IN
+                SELECT generate_series(
+                    DATE_TRUNC('month', CURRENT_DATE) - make_interval(months => months_back),
+                    DATE_TRUNC('month', CURRENT_DATE) + make_interval(months => months_ahead),
+                    INTERVAL '1 month'
+                )::DATE
+            LOOP
+                partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+                month_end := (month_start + INTERVAL '1 month')::DATE;
+                CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)',
+                               partition_name, parent);
+                EXECUTE format(
+                    'WITH moved AS (
+                         DELETE FROM %I WHERE occurred_at >= %L AND occurred_at < %L
+                         RETURNING *
+                     )
+                     INSERT INTO %I SELECT * FROM moved',
+                    parent || '_default', month_start, month_end, partition_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    parent, partition_name, month_start, month_end
+                );
+            END LOOP;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING 'create_event_partitions: could not create partitions for %: %',
+                parent, SQLERRM;
+        END;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cover the sample data's 12-month history plus the next few months
+SELECT create_event_partitions(13, 3);
+
+-- Keep creating partitions ahead of time when pg_cron is installed; without it,
+-- run SELECT create_event_partitions(); monthly from an external scheduler
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('create-event-partitions', '0 0 1 * *',
+                              'SELECT create_event_partitions()');
+    END IF;
+END
+$$;
 
 -- Indexes for performance
 CREATE INDEX idx_users_created_at ON users(created_at);
@@ -134,6 +213,12 @@ CREATE INDEX idx_funnel_events_user_id ON funnel_events(user_id);
 CREATE INDEX idx_funnel_events_event_name ON funnel_events(event_name);
 CREATE INDEX idx_funnel_events_occurred_at ON funnel_events(occurred_at);
 
+-- Partial indexes for the dashboard's time-windowed queries
+-- (keep in sync with migrations/dashboard_indexes.sql)
+CREATE INDEX idx_revenue_events_payments_occurred_at ON revenue_events(occurred_at) WHERE event_type = 'payment';
+CREATE INDEX idx_subscriptions_paid_started_at ON subscriptions(started_at) WHERE plan_id != 1;
+CREATE INDEX idx_subscriptions_cancelled_at ON subscriptions(cancelled_at) WHERE status = 'cancelled';
+
 -- Insert default plans
 INSERT INTO plans (name, price_monthly, price_annual, max_projects, max_team_members, features) VALUES
 ('free', 0, 0, 3, 1, '{"storage_gb": 1, "integrations": false, "priority_support": false}'),
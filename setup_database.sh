@@ -124,6 +124,25 @@ load_sample_data() {
     print_success "Sample data loaded successfully"
 }
 
+# Apply migrations (dashboard materialized views, etc.)
+apply_migrations() {
+    print_header "Applying Migrations"
+    
+    for migration in \
+        migrations/subscriptions_mrr_cents.sql \
+        migrations/dashboard_indexes.sql \
+        migrations/mv_dashboard.sql; do
+        if [ ! -f "$migration" ]; then
+            print_error "$migration file not found!"
+            exit 1
+        fi
+        
+        PGPASSWORD=$DB_PASSWORD psql -h $DB_HOST -p $DB_PORT -U $DB_USER -d $DB_NAME \
+            -v ON_ERROR_STOP=1 -f "$migration"
+        print_success "Applied $migration"
+    done
+}
+
 # Verify installation
 verify_setup() {
     print_header "Verifying Setup"
@@ -192,6 +211,7 @@ main() {
     setup_database
     create_schema
     load_sample_data
+    apply_migrations
     verify_setup
     generate_diagram
     show_connection_info